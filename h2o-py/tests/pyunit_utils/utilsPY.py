@@ -2451,9 +2451,28 @@ def write_hyper_parameters_json(dir1, dir2, json_filename, hyper_parameters):
     """
 
     # save hyper-parameter file in test directory
-    with open(os.path.join(dir1, json_filename), 'w') as test_file:
-        json.dump(hyper_parameters, test_file)
+    write_json_file(os.path.join(dir1, json_filename), hyper_parameters)
 
     # save hyper-parameter file in sandbox
-    with open(os.path.join(dir2, json_filename), 'w') as test_file:
-        json.dump(hyper_parameters, test_file)
\ No newline at end of file
+    write_json_file(os.path.join(dir2, json_filename), hyper_parameters)
+
+
+def write_json_file(json_filename, json_obj):
+    """
+    This function will write json_obj into a json file.  orjson is used if it is installed since it is much faster
+    than the json module.  Otherwise, the json module is used.
+
+    :param json_filename: String containing the json file name with full path
+    :param json_obj: dict or list to write out
+
+    :return: None.
+    """
+    try:
+        import orjson
+    except ImportError:
+        with open(json_filename, 'w') as json_file:
+            json.dump(json_obj, json_file)
+        return
+
+    with open(json_filename, 'wb') as json_file:
+        json_file.write(orjson.dumps(json_obj, option=orjson.OPT_SERIALIZE_NUMPY))
\ No newline at end of file
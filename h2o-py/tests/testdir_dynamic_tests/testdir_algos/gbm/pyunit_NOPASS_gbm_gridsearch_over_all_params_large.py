@@ -5,19 +5,114 @@ import random
 import os
 import numpy as np
 import math
+import operator
 from builtins import range
+from functools import reduce
 import time
-import json
+import uuid
 
 sys.path.insert(1, "../../../../")
 
 import h2o
 from tests import pyunit_utils
-from random import shuffle
 from h2o.estimators.gbm import H2OGradientBoostingEstimator
 from h2o.grid.grid_search import H2OGridSearch
 
-from h2o.estimators.glm import H2OGeneralizedLinearEstimator
+_current_dir = os.path.dirname(os.path.realpath(__file__))     # directory of this test file
+
+
+def _discover_gbm_params(family, x_indices, y_index, training_frame):
+    """
+    Build a bare bone GBM model and return the information needed to set up the gridsearch.
+
+    :param family: string denoting the distribution family of the GBM model
+    :param x_indices: list of predictor indices in training_frame
+    :param y_index: integer denoting the response index in training_frame
+    :param training_frame: H2OFrame used to train the bare bone GBM model
+
+    :return: tuple of model run time, minimum run time per tree, index of number_of_trees in the GBM model summary,
+    gridable_parameters, gridable_types, gridable_defaults and the model parameter names.
+    """
+    # build bare bone model to get all parameters
+    model = H2OGradientBoostingEstimator(distribution=family)
+    model.train(x=x_indices, y=y_index, training_frame=training_frame)
+
+    run_time = pyunit_utils.find_grid_runtime([model])  # find model train time
+    print("Time taken to build a base barebone model is {0}".format(run_time))
+
+    # model summary has the same header for all GBM models, find number_of_trees column only once
+    summary_list = model._model_json["output"]["model_summary"]
+    trees_col_idx = summary_list.col_header.index('number_of_trees')
+    num_trees = summary_list.cell_values[0][trees_col_idx]
+
+    if num_trees == 0:
+        min_runtime_per_tree = run_time
+    else:
+        min_runtime_per_tree = run_time / num_trees
+
+    # grab all gridable parameters and its type
+    (gridable_parameters, gridable_types, gridable_defaults) = \
+        pyunit_utils.get_gridables(model._model_json["parameters"])
+
+    return (run_time, min_runtime_per_tree, trees_col_idx, gridable_parameters, gridable_types, gridable_defaults,
+            list(model.full_parameters.keys()))
+
+
+def _hashable(value):
+    """
+    Convert a parameter value into something that can be used as part of a dict key.
+
+    :param value: parameter value used to build a model, lists are converted to tuples
+
+    :return: hashable version of value
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(x) for x in value)
+
+    return value
+
+
+def _fast_write_syn(csv_filenames, csv_weight_filename, row_count, col_count, max_p_value, min_p_value,
+                    max_w_value, min_w_value, noise_std, family_type, class_number=2):
+    """
+    Vectorized version of pyunit_utils.write_syn_floating_point_dataset_glm for real predictors/weights and
+    class_method set to 'probability'.  The responses of all data samples are derived with whole array NumPy
+    operations instead of looping over each data sample.
+
+    :param csv_filenames: list of strings representing full path filenames to store the data sets in.  Each data set
+    contains row_count samples.
+    :param csv_weight_filename: string representing full path filename to store intercept and weight used to generate
+    all data sets.
+    :param row_count: integer representing number of samples (predictor, response) in each data set
+    :param col_count: integer representing the number of predictors in the data set
+    :param max_p_value: integer representing maximum predictor values
+    :param min_p_value: integer representing minimum predictor values
+    :param max_w_value: integer representing maximum intercept/weight values
+    :param min_w_value: integer representing minimum intercept/weight values
+    :param noise_std: Gaussian noise standard deviation used to generate noise e to add to response
+    :param family_type: string, either 'gaussian' or 'multinomial'
+    :param class_number: integer, optional, representing number of classes for multinomial
+
+    :return: None
+    """
+    num_class = class_number if 'multinomial' in family_type else 1
+
+    # generate bias b and weight as one column per class
+    weight = np.random.uniform(min_w_value, max_w_value, (col_count+1, num_class))
+    np.savetxt(csv_weight_filename, weight.transpose(), delimiter=',', fmt='%.6g')
+
+    for csv_filename in csv_filenames:
+        x_mat = np.random.uniform(min_p_value, max_p_value, (row_count, col_count))
+        response_y = weight[0] + x_mat.dot(weight[1:]) + noise_std * np.random.standard_normal((row_count, 1))
+
+        if 'multinomial' in family_type:
+            # choose the class of each sample according to prob(y=k) = exp(y_k)/sum(exp(y))
+            prob_mat = np.exp(response_y)
+            prob_mat = np.cumsum(prob_mat, axis=1) / np.sum(prob_mat, axis=1, keepdims=True)
+            random_v = np.random.uniform(0, 1, (row_count, 1))
+            response_y = np.argmax(random_v < prob_mat, axis=1).reshape(row_count, 1)
+
+        np.savetxt(csv_filename, np.column_stack([x_mat, response_y]), delimiter=',', fmt='%.6g')
 
 
 class Test_glm_grid_search:
@@ -64,23 +159,28 @@ class Test_glm_grid_search:
 
     max_grid_model = 20           # maximum number of grid models generated
 
+    training_metric = 'MSE'         # metric used for early stopping of grid search
+    stopping_rounds = 3             # stop grid search if training_metric does not improve over this many models
+    stopping_tolerance = 1e-3       # relative improvement of training_metric needed to keep building grid models
+
     class_number = 2                # number of response class for classification, randomly determined later
 
-    curr_time = str(round(time.time()))     # store current timestamp, used as part of filenames.
+    run_token = uuid.uuid4().hex[:12]   # unique token of this run, used as part of filenames.
+    seed = int(round(time.time()))    # seed used by random number generators and randomized grid search
 
     # parameters denoting filenames of interested that store training/validation/test data sets in csv format
-    training1_filename = "gridsearch_training1_"+curr_time+"_set.csv"
-    training2_filename = "gridsearch_training2_"+curr_time+"_set.csv"
-    training3_filename = "gridsearch_training3_"+curr_time+"_set.csv"
+    training1_filename = "gridsearch_gbm_training1_"+run_token+"_set.csv"
+    training2_filename = "gridsearch_gbm_training2_"+run_token+"_set.csv"
+    training3_filename = "gridsearch_gbm_training3_"+run_token+"_set.csv"
 
-    json_filename = "gridsearch_hyper_parameter_" + curr_time + ".json"
+    json_filename = "gridsearch_gbm_hyper_parameter_" + run_token + ".json"
 
-    weight_filename = "gridsearch_"+curr_time+"_weight.csv"
+    weight_filename = "gridsearch_gbm_"+run_token+"_weight.csv"
 
     allowed_diff = 1e-5   # value of p-values difference allowed between theoretical and h2o p-values
 
     # System parameters, do not change.  Dire consequences may follow if you do
-    current_dir = os.path.dirname(os.path.realpath(sys.argv[1]))    # directory of this test file
+    current_dir = _current_dir      # directory of this test file
 
     noise_std = 0.01            # noise variance in Gaussian noise generation added to response
     noise_var = noise_std*noise_std     # Gaussian noise variance
@@ -114,51 +214,57 @@ class Test_glm_grid_search:
     sandbox_dir = ""  # sandbox directory where we are going to save our failed test data sets
 
     # store information about training/test data sets
-    x_indices = []              # store predictor indices in the data set
     y_index = 0                 # store response index in the data set
 
-    training1_data = []         # store training data sets
-    training2_data = []         # store training data sets
-    training3_data = []
-
     total_test_number = 3       # number of tests carried out
     test_failed = 0             # count total number of tests that have failed
-    test_failed_array = [0]*total_test_number   # denote test results for all tests run.  1 error, 0 pass
     test_num = 0                # index representing which test is being run
 
-    # give the user opportunity to pre-assign hyper parameters for fixed values
-    hyper_params = dict()
-    hyper_params["balance_classes"] = [True, False]
-    hyper_params["fold_assignment"] = ["AUTO", "Random", "Modulo"]
-    hyper_params["stopping_metric"] =["AUTO", "deviance", "MSE", "r2"]
-    hyper_params["random_split_points"] = [True, False]
-
-    # parameters to be excluded from hyper parameter list even though they may be gridable
-    exclude_parameter_lists = ['distribution', 'tweedie_power', 'validation_frame', 'response_column',
-                               'sample_rate_per_class']   # do not need these
-
-    # these are supposed to be gridable but are not really
-    exclude_parameter_lists.extend(['class_sampling_factors', 'fold_column', 'weights_column', 'offset_column',
-                                    'build_tree_one_node', 'score_each_iteration', 'max_hit_ratio_k',
-                                    'score_tree_interval', 'nbins_top_level'])
-
     params_zero_one = ['col_sample_rate', 'learn_rate_annealing', 'learn_rate', 'col_sample_rate_per_tree',
                        'sample_rate']
     params_more_than_zero = ['min_rows', 'max_depth', 'ntrees', "max_after_balance_size"]
     params_more_than_one = ['nbins_cats', 'nbins']
     params_zero_positive = ['max_runtime_secs', 'stopping_rounds', 'stopping_tolerance']       # >= 0
 
-    final_hyper_params = dict()     # store the final hyper-parameters that we are going to use
-    gridable_parameters = []    # store griddable parameter names
-    gridable_types = []         # store the corresponding griddable parameter types
-    gridable_defaults = []      # store the gridabble parameter default values
-
     possible_number_models = 0      # possible number of models built based on hyper-parameter specification
     correct_model_number = 0        # count number of models built with bad hyper-parameter specification
     true_correct_model_number = 0   # count number of models built with good hyper-parameter specification
     nfolds = 5                      # enable cross validation to test fold_assignment
 
     def __init__(self):
+        # mutable states are created per instance so that repeated runs do not share them through the class
+
+        # store information about training/test data sets
+        self.x_indices = []             # store predictor indices in the data set
+
+        self.training1_data = []        # store training data sets
+        self.training2_data = []        # store training data sets
+        self.training3_data = []
+
+        self.test_failed_array = [0]*self.total_test_number   # denote test results for all tests run.  1 error, 0 pass
+
+        # give the user opportunity to pre-assign hyper parameters for fixed values
+        self.hyper_params = dict()
+        self.hyper_params["balance_classes"] = [True, False]
+        self.hyper_params["fold_assignment"] = ["AUTO", "Random", "Modulo"]
+        self.hyper_params["stopping_metric"] = ["AUTO", "deviance", "MSE", "r2"]
+        self.hyper_params["random_split_points"] = [True, False]
+
+        # parameters to be excluded from hyper parameter list even though they may be gridable
+        self.exclude_parameter_lists = ['distribution', 'tweedie_power', 'validation_frame', 'response_column',
+                                        'sample_rate_per_class']   # do not need these
+
+        # these are supposed to be gridable but are not really
+        self.exclude_parameter_lists.extend(['class_sampling_factors', 'fold_column', 'weights_column',
+                                             'offset_column', 'build_tree_one_node', 'score_each_iteration',
+                                             'max_hit_ratio_k', 'score_tree_interval', 'nbins_top_level'])
+
+        self.final_hyper_params = dict()    # store the final hyper-parameters that we are going to use
+        self.gridable_parameters = []       # store griddable parameter names
+        self.gridable_types = []            # store the corresponding griddable parameter types
+        self.gridable_defaults = []         # store the gridabble parameter default values
+
+        self._manual_cache = dict()     # store (mse, run time, tree number) of manually built models
         self.setup_data()
         self.setup_model()
 
@@ -173,6 +279,11 @@ class Test_glm_grid_search:
         4. load the data sets and set the training set indices and response column index
         """
 
+        # seed all random number generators so that a failed run can be reproduced
+        print("Random seed used by this test is {0}".format(self.seed))
+        random.seed(self.seed)
+        np.random.seed(self.seed & 0xFFFFFFFF)
+
         # create and clean out the sandbox directory first
         self.sandbox_dir = pyunit_utils.make_Rsandbox_dir(self.current_dir, self.test_name, True)
 
@@ -195,43 +306,51 @@ class Test_glm_grid_search:
         #### This is used to generate dataset for regression or classification.  Nothing to do
         #### with setting the distribution family in this case
         # randomly choose which family of GLM algo to use
-        self.family = self.families[random.randint(0, len(self.families)-1)]
+        self.family = random.choice(self.families)
 
         # set class number for classification
         if 'multinomial' in self.family:
             self.class_number = random.randint(2, self.max_class_number)    # randomly set number of classes K
 
         # generate real value weight vector and training/validation/test data sets for GLM
-        pyunit_utils.write_syn_floating_point_dataset_glm(self.training1_data_file, self.training2_data_file,
-                                                          self.training3_data_file, self.weight_data_file,
-                                                          self.train_row_count, self.train_col_count, 2,
-                                                          self.max_p_value, self.min_p_value, self.max_w_value,
-                                                          self.min_w_value, self.noise_std, self.family,
-                                                          self.train_row_count, self.train_row_count,
-                                                          class_number=self.class_number,
-                                                          class_method=['probability', 'probability',
-                                                                        'probability'])
-
-        # preload data sets
-        self.training1_data = h2o.import_file(pyunit_utils.locate(self.training1_data_file))
-        self.training2_data = h2o.import_file(pyunit_utils.locate(self.training2_data_file))
-        self.training3_data = h2o.import_file(pyunit_utils.locate(self.training3_data_file))
+        if os.environ.get("PYUNIT_USE_GLM_DATA_HELPER"):
+            pyunit_utils.write_syn_floating_point_dataset_glm(self.training1_data_file, self.training2_data_file,
+                                                              self.training3_data_file, self.weight_data_file,
+                                                              self.train_row_count, self.train_col_count, 2,
+                                                              self.max_p_value, self.min_p_value, self.max_w_value,
+                                                              self.min_w_value, self.noise_std, self.family,
+                                                              self.train_row_count, self.train_row_count,
+                                                              class_number=self.class_number,
+                                                              class_method=['probability', 'probability',
+                                                                            'probability'])
+        else:
+            _fast_write_syn([self.training1_data_file, self.training2_data_file, self.training3_data_file],
+                            self.weight_data_file, self.train_row_count, self.train_col_count, self.max_p_value,
+                            self.min_p_value, self.max_w_value, self.min_w_value, self.noise_std, self.family,
+                            class_number=self.class_number)
+
+        # preload data sets, all predictors are real and the response is categorical for classification tasks.
+        # The csv files are imported instead of uploading the arrays with h2o.H2OFrame(), which writes its own
+        # temporary csv file with the Python csv module before posting it to the server.
+        col_types = ['numeric']*self.train_col_count + (['enum'] if 'multinomial' in self.family else ['numeric'])
+
+        self.training1_data = h2o.import_file(pyunit_utils.locate(self.training1_data_file), col_types=col_types,
+                                              destination_frame="gbm_train1_"+self.run_token)
+        self.training2_data = h2o.import_file(pyunit_utils.locate(self.training2_data_file), col_types=col_types,
+                                              destination_frame="gbm_train2_"+self.run_token)
+        self.training3_data = h2o.import_file(pyunit_utils.locate(self.training3_data_file), col_types=col_types,
+                                              destination_frame="gbm_train3_"+self.run_token)
 
         # set data set indices for predictors and response
         self.y_index = self.training1_data.ncol-1
-        self.x_indices = list(range(self.y_index))
+        self.x_indices = list(range(self.y_index))     # .train() only accepts a list of predictor indices
 
-        # set response to be categorical for classification tasks
+        # check to make sure all response classes are represented, otherwise, quit
         if 'multinomial' in self.family:
-            self.training1_data[self.y_index] = self.training1_data[self.y_index].round().asfactor()
-
-            # check to make sure all response classes are represented, otherwise, quit
             if self.training1_data[self.y_index].nlevels()[0] < self.class_number:
                 print("Response classes are not represented in training dataset.")
                 sys.exit(0)
 
-            self.training2_data[self.y_index] = self.training2_data[self.y_index].round().asfactor()
-            self.training3_data[self.y_index] = self.training2_data[self.y_index].round().asfactor()
             # self.hyper_params["validation_frame"] = [self.training1_data.frame_id, self.training2_data.frame_id,
             #                                          self.training3_data.frame_id]
 
@@ -251,29 +370,15 @@ class Test_glm_grid_search:
 
         :return: None
         """
-        # build bare bone model to get all parameters
-        model = H2OGradientBoostingEstimator(distribution=self.family)
-        model.train(x=self.x_indices, y=self.y_index, training_frame=self.training1_data)
-
-        run_time = pyunit_utils.find_grid_runtime([model])  # find model train time
-        print("Time taken to build a base barebone model is {0}".format(run_time))
-
-        summary_list = model._model_json["output"]["model_summary"]
-        num_trees = summary_list.cell_values[0][summary_list.col_header.index('number_of_trees')]
-
-        if num_trees == 0:
-            self.min_runtime_per_tree = run_time
-        else:
-            self.min_runtime_per_tree = run_time / num_trees
-
-        # grab all gridable parameters and its type
-        (self.gridable_parameters, self.gridable_types, self.gridable_defaults) = \
-            pyunit_utils.get_gridables(model._model_json["parameters"])
+        # build bare bone model to get all parameters and the baseline run time
+        (run_time, self.min_runtime_per_tree, self._trees_col_idx, self.gridable_parameters, self.gridable_types,
+         self.gridable_defaults, model_params) = _discover_gbm_params(self.family, self.x_indices, self.y_index,
+                                                                      self.training1_data)
 
         # randomly generate griddable parameters including values outside legal range, like setting alpha values to
         # be outside legal range of 0 and 1 and etc
         (self.hyper_params, self.gridable_parameters, self.gridable_types, self.gridable_defaults) = \
-            pyunit_utils.gen_grid_search(model.full_parameters.keys(), self.hyper_params,
+            pyunit_utils.gen_grid_search(model_params, self.hyper_params,
                                          self.exclude_parameter_lists,
                                          self.gridable_parameters, self.gridable_types, self.gridable_defaults,
                                          random.randint(1, self.max_int_number),
@@ -283,25 +388,13 @@ class Test_glm_grid_search:
 
         # scale the max_runtime_secs parameters
         time_scale = self.time_scale * run_time
-        if "max_runtime_secs" in list(self.hyper_params):
-            self.hyper_params["max_runtime_secs"] = [time_scale * x for x
-                                                     in self.hyper_params["max_runtime_secs"]]
+        if "max_runtime_secs" in self.hyper_params:
+            max_runtime_arr = np.asarray(self.hyper_params["max_runtime_secs"], dtype=np.float64)
+            self.hyper_params["max_runtime_secs"] = (max_runtime_arr * time_scale).tolist()
 
+        # randomized grid search will sample at most max_grid_model models out of the legal hyper-parameter space
         self.possible_number_models = self.check_and_count_models()
 
-        self.final_hyper_params["max_runtime_secs"] = self.hyper_params["max_runtime_secs"]
-
-        # calculate true possible_number_models and exclude the bad parameters since they will not
-        # result in any models being built
-        # alpha_len = len(self.hyper_params["alpha"])
-        # lambda_len = len(self.hyper_params["lambda"])
-        time_len = len(self.hyper_params["max_runtime_secs"])
-        # len_good_alpha = len([x for x in self.hyper_params["alpha"] if (x >= 0) and (x <= 1)])
-        # len_good_lambda = len([x for x in self.hyper_params["lambda"] if (x >= 0)])
-        len_good_time = len([x for x in self.hyper_params["max_runtime_secs"] if (x >= 0)])
-
-        self.possible_number_models = int(self.possible_number_models*len_good_time/time_len)
-
         # write out the hyper-parameters used into json files.
         pyunit_utils.write_hyper_parameters_json(self.current_dir, self.sandbox_dir, self.json_filename,
                                                  self.final_hyper_params)
@@ -310,40 +403,44 @@ class Test_glm_grid_search:
         """
         This function will look at the hyper-parameter space and determine how many models will be built from
         it.  In order to arrive at the correct answer, it must discount parameter settings that are illegal.
+        Hyper-parameters without any legal values are left out of final_hyper_params, except max_runtime_secs
+        which is always tested.  If none of its values are legal, no model can be built.
 
-        :return: total_model: integer, total number of models built from all legal parameter settings.
+        :return: total_model: integer, total number of models built from all legal parameter settings, capped
+        at max_grid_model.
         """
+        legal_values = {param: self._filter_values(param, values) for param, values in self.hyper_params.items()}
+
+        self.final_hyper_params = {param: self.hyper_params[param] for param in self.hyper_params
+                                   if (len(legal_values[param]) > 0) or (param == "max_runtime_secs")}
 
-        total_model = 1
-        param_len = 0
-        hyper_keys = list(self.hyper_params)
-        shuffle(hyper_keys)    # get all hyper_parameter names
-
-        for param in hyper_keys:
-
-            # this param should be between 0 and 2
-            if param == "col_sample_rate_change_per_level":
-                param_len = len([x for x in self.hyper_params["col_sample_rate_change_per_level"] if (x >= 0)
-                                 and (x <= 2)])
-            elif param in self.params_zero_one:
-                param_len = len([x for x in self.hyper_params[param] if (x >= 0)
-                                        and (x <= 1)])
-            elif param in self.params_more_than_zero:
-                param_len = len([x for x in self.hyper_params[param] if (x > 0)])
-            elif param in self.params_more_than_one:
-                param_len = len([x for x in self.hyper_params[param] if (x > 1)])
-            elif param in self.params_zero_positive:
-                param_len = len([x for x in self.hyper_params[param] if (x >= 0)])
-            else:
-                param_len = len(self.hyper_params[param])
-
-            if (param_len > 0) and ((total_model*param_len) <= self.max_grid_model):
-                total_model *= param_len
-                self.final_hyper_params[param] = self.hyper_params[param]
-            else:
-                break
-
-        return total_model
+        total_model = reduce(operator.mul, [len(legal_values[param]) for param in self.final_hyper_params], 1)
+
+        return min(total_model, self.max_grid_model)
+
+    def _filter_values(self, param, values):
+        """
+        This function returns the legal values out of the grid values of one hyper-parameter.
+
+        :param param: string denoting the hyper-parameter name
+        :param values: list of grid values of the hyper-parameter
+
+        :return: list or numpy array containing the legal values of the hyper-parameter
+        """
+        if param == "col_sample_rate_change_per_level":     # this param should be between 0 and 2
+            value_arr = np.asarray(values)
+            return value_arr[(value_arr >= 0) & (value_arr <= 2)]
+        elif param in self.params_zero_one:
+            value_arr = np.asarray(values)
+            return value_arr[(value_arr >= 0) & (value_arr <= 1)]
+        elif param in self.params_more_than_zero:
+            return [x for x in values if x > 0]
+        elif param in self.params_more_than_one:
+            return [x for x in values if x > 1]
+        elif param in self.params_zero_positive:
+            return [x for x in values if x >= 0]
+        else:
+            return values
 
     def tear_down(self):
         """
@@ -362,10 +459,7 @@ class Test_glm_grid_search:
 
             # write out the jenkins job info into log files.
             json_file = os.path.join(self.sandbox_dir, self.json_filename)
-
-            with open(json_file,'wb') as test_file:
-                json.dump(self.hyper_params, test_file)
-
+            pyunit_utils.write_json_file(json_file, self.hyper_params)
 
         else:   # all tests have passed.  Delete sandbox if if was not wiped before
             pyunit_utils.make_Rsandbox_dir(self.current_dir, self.test_name, False)
@@ -393,12 +487,23 @@ class Test_glm_grid_search:
         print("test_gbm_grid_search_over_params for GBM " + self.family)
         h2o.cluster_info()
 
+        # no model can be built out of illegal hyper-parameter values, skip the grid search altogether
+        if self.possible_number_models == 0:
+            print("test_gbm_grid_search_over_params for GBM: no legal models can be built, skipping the test.")
+            return
+
         try:
             print("Hyper-parameters used here is {0}".format(self.final_hyper_params))
 
-            # start grid search
-            grid_model = H2OGridSearch(H2OGradientBoostingEstimator(nfolds=self.nfolds),
-                                       hyper_params=self.final_hyper_params)
+            # start randomized grid search, only need to verify up to max_grid_model models.  Grid search stops
+            # early when new models no longer improve on the earlier ones.
+            search_criteria = {'strategy': 'RandomDiscrete', 'max_models': self.max_grid_model, 'seed': self.seed,
+                               'stopping_metric': self.training_metric, 'stopping_rounds': self.stopping_rounds,
+                               'stopping_tolerance': self.stopping_tolerance}
+            print("GBM grid search_criteria: {0}".format(search_criteria))
+
+            grid_model = H2OGridSearch(H2OGradientBoostingEstimator(distribution=self.family, nfolds=self.nfolds),
+                                       hyper_params=self.final_hyper_params, search_criteria=search_criteria)
             grid_model.train(x=self.x_indices, y=self.y_index, training_frame=self.training1_data)
 
             self.correct_model_number = len(grid_model)     # store number of models built
@@ -408,52 +513,39 @@ class Test_glm_grid_search:
 
             # add parameters into params_dict.  Use this to manually build model
             params_dict = dict()
-            params_dict["family"] = self.family
+            params_dict["distribution"] = self.family
             params_dict["nfolds"] = self.nfolds
             total_run_time_limits = 0.0   # calculate upper bound of max_runtime_secs
             true_run_time_limits = 0.0
             manual_run_runtime = 0.0
 
-            # compare MSE performance of model built by gridsearch with manually built model
+            # compare MSE performance of model built by gridsearch with manually built model.  Models are built one
+            # after another like grid search does, otherwise contention on the cluster would stop fits with
+            # max_runtime_secs early and inflate their run time.
             for each_model in grid_model:
-
                 # grab parameters used by grid search and build a dict out of it
-                params_list = pyunit_utils.extract_used_params(self.final_hyper_params.keys(), each_model.params,
-                                                               params_dict)
+                (params_list, max_runtime, manual_key) = self.extract_manual_params(each_model, params_dict)
 
-                # need to taken out max_runtime_secs from model parameters, it is now set in .train()
-                if "max_runtime_secs" in params_list:
-                    max_runtime = params_list["max_runtime_secs"]
-                    del params_list["max_runtime_secs"]
-                else:
-                    max_runtime = 0
+                # models with the same parameter setting only need to be built manually once
+                if manual_key not in self._manual_cache:
+                    self._manual_cache[manual_key] = self.build_manual_model(params_list, max_runtime)
 
-                manual_model = H2OGeneralizedLinearEstimator(**params_list)
-                manual_model.train(x=self.x_indices, y=self.y_index, training_frame=self.training1_data,
-                                   max_runtime_secs=max_runtime)
+                (manual_mse, model_runtime, tree_num) = self._manual_cache[manual_key]
 
                 # collect the time taken to manually built all models
-                model_runtime = pyunit_utils.find_grid_runtime([manual_model])  # time taken to build this model
                 manual_run_runtime += model_runtime
 
-                summary_list = manual_model._model_json['output']['model_summary']
-                iteration_num = summary_list.cell_values[0][summary_list.col_header.index('number_of_iterations')]
-
                 if max_runtime > 0:
                     # shortest possible time it takes to build this model
-                    if (max_runtime < self.min_runtime_per_tree) or (iteration_num <= 1):
+                    if (max_runtime < self.min_runtime_per_tree) or (tree_num <= 1):
                         total_run_time_limits += model_runtime
                     else:
                         total_run_time_limits += max_runtime
 
                 true_run_time_limits += max_runtime
 
-                # compute and compare test metrics between the two models
-                test_grid_model_metrics = each_model.model_performance(test_data=self.training2_data)
-                test_manual_model_metrics = manual_model.model_performance(test_data=self.training2_data)
-
-                # just compare the mse in this case within tolerance:
-                if abs(test_grid_model_metrics.mse() - test_manual_model_metrics.mse()) > self.allowed_diff:
+                # just compare the test mse in this case within tolerance:
+                if abs(self.score_test_mse(each_model) - manual_mse) > self.allowed_diff:
                     self.test_failed += 1             # count total number of tests that have failed
                     self.test_failed_array[self.test_num] += 1
                     print("test_gbm_grid_search_over_params for GLM failed: grid search model and manually "
@@ -463,7 +555,7 @@ class Test_glm_grid_search:
             total_run_time_limits = max(total_run_time_limits, true_run_time_limits) * (1+self.extra_time_fraction)
 
             # # # make sure the correct number of models are built by gridsearch
-            # if not (self.correct_model_number == self.possible_number_models):  # wrong grid model number
+            # if not (self.correct_model_number <= self.possible_number_models):  # early stopping can build fewer
             #     self.test_failed += 1
             #     self.test_failed_array[self.test_num] = 1
             #     print("test_gbm_grid_search_over_params for GLM failed: number of models built by gridsearch "
@@ -483,6 +575,62 @@ class Test_glm_grid_search:
             if self.possible_number_models > 0:
                 print("test_gbm_grid_search_over_params for GLM failed: exception was thrown for no reason.")
 
+    def extract_manual_params(self, each_model, params_dict):
+        """
+        This function grabs the parameters used by grid search to build each_model so that we can build the same
+        model manually.
+
+        :param each_model: a model built by grid search
+        :param params_dict: dict containing extra parameters to add to the manually built model
+
+        :return: params_list: dict of parameters used to build the model manually, max_runtime: max_runtime_secs
+        used by grid search which is set in .train() and manual_key: hashable key denoting the parameter setting
+        """
+        params_list = pyunit_utils.extract_used_params(self.final_hyper_params.keys(), each_model.params,
+                                                       params_dict, algo="GBM")
+
+        # need to taken out max_runtime_secs from model parameters, it is now set in .train()
+        if "max_runtime_secs" in params_list:
+            max_runtime = params_list["max_runtime_secs"]
+            del params_list["max_runtime_secs"]
+        else:
+            max_runtime = 0
+
+        manual_key = (frozenset((k, _hashable(v)) for k, v in params_list.items()), max_runtime)
+
+        return params_list, max_runtime, manual_key
+
+    def build_manual_model(self, params_list, max_runtime):
+        """
+        This function manually builds a H2O GBM model with the parameters used by grid search and scores it
+        on the test set.
+
+        :param params_list: dict of parameters used to build the model
+        :param max_runtime: max_runtime_secs used to build the model
+
+        :return: tuple of test MSE, time taken to build the model and number of trees built
+        """
+        manual_model = H2OGradientBoostingEstimator(**params_list)
+        manual_model.train(x=self.x_indices, y=self.y_index, training_frame=self.training1_data,
+                           max_runtime_secs=max_runtime)
+
+        model_runtime = pyunit_utils.find_grid_runtime([manual_model])  # time taken to build this model
+
+        summary_list = manual_model._model_json['output']['model_summary']
+        tree_num = summary_list.cell_values[0][self._trees_col_idx]
+
+        return manual_model.model_performance(test_data=self.training2_data).mse(), model_runtime, tree_num
+
+    def score_test_mse(self, model):
+        """
+        This function returns the MSE of a model calculated on the test set.
+
+        :param model: H2O model to score
+
+        :return: float, test MSE of the model
+        """
+        return model.model_performance(test_data=self.training2_data).mse()
+
 
 def test_grid_search_for_gbm_over_all_params():
     """